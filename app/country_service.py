@@ -1,72 +1,259 @@
 import os
-import json
 import asyncio
-from groq import AsyncGroq
-from pydantic import BaseModel, HttpUrl, ValidationError, TypeAdapter
-from typing import List, Dict, Any
+import hashlib
+import logging
+import re
+import time
+import diskcache
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
+from pathlib import Path
+from groq import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncGroq,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+from groq.types.chat import ChatCompletion
+from pydantic import BaseModel, ValidationError, TypeAdapter
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 class FintechStartup(BaseModel):
     name: str
     description: str
-    website: HttpUrl
+    website: str
+
+# Cheap sanity check for AI-supplied websites; full URL parsing isn't needed
+# just to render a link.
+_URL_RE = re.compile(r'^https?://\S+$')
+
+def _clean_website(value: Any) -> Optional[str]:
+    """Returns a normalized website URL, or None if it doesn't look like one."""
+    if not isinstance(value, str):
+        return None
+    website = value.strip().rstrip('.')
+    return website if _URL_RE.match(website) else None
+
+_STARTUPS_ADAPTER: TypeAdapter[List[FintechStartup]] = TypeAdapter(List[FintechStartup])
+
+# Kept constant so every request shares the same prefix, which lets the
+# provider reuse its prompt cache.
+_COUNTRY_SYSTEM_PROMPT = """You are a helpful historian and financial data analyst. Return ONLY a valid JSON object.
+The object must have exactly these 2 fields:
+- "history": string (a brief history of the country, focusing on its early days and key historical milestones, about 3-4 paragraphs)
+- "startups": array of objects, each with exactly these 3 fields:
+  - "name": string (the startup's name)
+  - "description": string (one sentence description)
+  - "website": string (full URL starting with https://)
+
+Example format:
+{
+  "history": "Paragraph one...\\n\\nParagraph two...",
+  "startups": [
+    {
+      "name": "Example Fintech",
+      "description": "A digital payment platform.",
+      "website": "https://example.com"
+    }
+  ]
+}
+
+Use an empty array [] for "startups" if no data is found. Do not add any other text."""
+
+_REPAIR_SYSTEM_PROMPT = """You fix JSON data. The user sends startup data that failed validation, along with the validation errors.
+Return ONLY a valid JSON object with a "startups" field: an array of objects, each with exactly these 3 fields:
+- "name": string (the startup's name)
+- "description": string (one sentence description)
+- "website": string (full URL starting with https://)
+
+Drop any entry you cannot fix. Do not add any other text."""
+
+CACHE_MAXSIZE = 1024
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "86400"))
+DISK_CACHE_DIR = os.getenv("CACHE_DIR", ".cache/groq")
+DISK_CACHE_TTL_SECONDS = int(os.getenv("DISK_CACHE_TTL_SECONDS", str(7 * 86400)))
+# Committed {"history": ..., "startups": [...]} payloads, one <country>.json per file.
+PRECOMPUTED_DIR = Path(os.getenv("PRECOMPUTED_DIR", Path(__file__).resolve().parent.parent / "data" / "precomputed"))
+
+# Bump when the prompts change so answers cached under the old prompts are ignored.
+PROMPT_VERSION = 1
+
+def _normalize_country(country: str) -> str:
+    return country.strip().lower()
+
+def _cache_key(model_name: str, country: str) -> Tuple[str, int, str]:
+    return (model_name, PROMPT_VERSION, _normalize_country(country))
+
+# Caps concurrent Groq requests so bursts don't trip the provider's rate limits.
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", "10"))
+# Paces requests to just under the account's requests-per-minute budget.
+# GROQ_RPM is the total for the deployment; each worker process gets its
+# share, with WEB_CONCURRENCY defaulting to the Procfile's worker count.
+GROQ_RPM = int(os.getenv("GROQ_RPM", "25"))
+WORKER_GROQ_RPM = max(1, GROQ_RPM // int(os.getenv("WEB_CONCURRENCY", "2")))
+
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "10"))
+# Retries for transient failures: 429s, 5xx responses and dropped connections.
+# A timed-out attempt is retried at most once so a hung call can't stack timeouts.
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+# APITimeoutError is a subclass of APIConnectionError.
+_RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+# Circuit breaker: after BREAKER_THRESHOLD failed Groq calls within
+# BREAKER_WINDOW_SECONDS, calls fail fast for BREAKER_COOLDOWN_SECONDS.
+BREAKER_THRESHOLD = 5
+BREAKER_WINDOW_SECONDS = 60.0
+BREAKER_COOLDOWN_SECONDS = 30.0
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Groq while the circuit breaker is open."""
+
+# One Groq client per process, so its connection pool stays warm across requests.
+_GROQ_CLIENT: Optional[AsyncGroq] = None
+
+def _get_client() -> AsyncGroq:
+    global _GROQ_CLIENT
+    if _GROQ_CLIENT is None:
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY environment variable not set.")
+        _GROQ_CLIENT = AsyncGroq(
+            api_key=api_key,
+            # No SDK retries: each HTTP attempt is bounded by GROQ_TIMEOUT_SECONDS
+            # and counts towards the circuit breaker on its own.
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+            ),
+        )
+    return _GROQ_CLIENT
+
+async def close_client() -> None:
+    """Closes the shared Groq client. Called on application shutdown."""
+    global _GROQ_CLIENT
+    if _GROQ_CLIENT is not None:
+        await _GROQ_CLIENT.close()
+        _GROQ_CLIENT = None
 
 class CountryService:
     """
     This class contains the core business logic.
     It uses the Groq API to get real data.
     """
+    # The prompt asks for the top 5; anything beyond that is ignored.
+    MAX_STARTUPS = 5
+
     def __init__(self):
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY environment variable not set.")
-        self.client = AsyncGroq(api_key=api_key)
+        self.client = _get_client()
         self.model_name = "llama-3.1-8b-instant"
+        # (history, startups) per country; the reply is formatted per request so
+        # it echoes each caller's spelling. Only successful results are cached,
+        # so a failed lookup is retried next time. Call cache.clear() to flush.
+        self.cache: TTLCache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECONDS)
+        # Groq payloads persisted across restarts and shared between workers.
+        self.disk_cache = diskcache.Cache(DISK_CACHE_DIR)
+        self._precomputed = self._load_precomputed(PRECOMPUTED_DIR)
+        self._inflight: Dict[Tuple[str, int, str], asyncio.Future[Tuple[Optional[str], List[FintechStartup]]]] = {}
+        # Built per service rather than at import, so they belong to the event
+        # loop the service runs on.
+        self._groq_sem = asyncio.Semaphore(GROQ_CONCURRENCY)
+        self._groq_limiter = AsyncLimiter(max_rate=WORKER_GROQ_RPM, time_period=60)
+        self._fail_count = 0
+        self._first_fail_at = 0.0
+        self._open_until = 0.0
 
-    async def _get_real_history(self, country: str) -> str:
-        """Gets the real history of a country using the Groq API."""
-        print(f"Getting history for {country} (using Groq)...")
-        prompt = f"Provide a brief history of {country}, focusing on its early days and key historical milestones. Keep it to about 3-4 paragraphs."
-        try:
-            chat_completion = await self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You are a helpful historian."},
-                    {"role": "user", "content": prompt}
-                ],
-                model=self.model_name,
-                temperature=0.2,
-            )
-            content = chat_completion.choices[0].message.content
-            if content is None:
-                raise ValueError("API returned empty content for history")
-            print("...History received.")
-            return content
-        except Exception as e:
-            print(f"Error getting history: {e}")
-            return f"Error: Could not retrieve history for {country}."
+    @staticmethod
+    def _load_precomputed(directory: Path) -> Dict[str, Tuple[str, List[FintechStartup]]]:
+        """Loads pre-baked country payloads so common countries skip Groq entirely."""
+        precomputed = {}
+        for path in directory.glob("*.json"):
+            try:
+                data = orjson.loads(path.read_bytes())
+                precomputed[_normalize_country(path.stem)] = (
+                    data["history"],
+                    _STARTUPS_ADAPTER.validate_python(data["startups"]),
+                )
+            except (orjson.JSONDecodeError, KeyError, TypeError, ValidationError) as e:
+                logger.warning("Skipping invalid precomputed payload %s: %s", path, e)
+        return precomputed
+
+    async def _create_completion(self, **kwargs: Any) -> ChatCompletion:
+        """
+        Sends a chat completion request to Groq, paced by the rate limiter,
+        bounded by the shared semaphore and guarded by the circuit breaker.
+        Transient failures are retried, each attempt going back through the
+        limiter and the breaker so retries stay within the RPM budget.
+        """
+        attempt = 0
+        timed_out = False
+        while True:
+            if time.monotonic() < self._open_until:
+                raise CircuitOpenError("Groq circuit breaker is open")
+            try:
+                async with self._groq_limiter, self._groq_sem:
+                    chat_completion = await self.client.chat.completions.create(
+                        model=self.model_name,
+                        timeout=GROQ_TIMEOUT_SECONDS,
+                        **kwargs,
+                    )
+            except _RETRYABLE_ERRORS as e:
+                self._record_failure()
+                is_timeout = isinstance(e, APITimeoutError)
+                if attempt >= GROQ_MAX_RETRIES or (is_timeout and timed_out):
+                    raise
+                timed_out = timed_out or is_timeout
+                # Backs off outside the semaphore so other calls can proceed.
+                await asyncio.sleep(2 ** attempt)
+                attempt += 1
+                continue
+            except Exception:
+                self._record_failure()
+                raise
+            self._fail_count = 0
+            return chat_completion
+
+    def _record_failure(self) -> None:
+        now = time.monotonic()
+        if now - self._first_fail_at > BREAKER_WINDOW_SECONDS:
+            self._fail_count = 0
+            self._first_fail_at = now
+        self._fail_count += 1
+        if self._fail_count >= BREAKER_THRESHOLD:
+            logger.warning("Groq failed %d times, opening circuit breaker for %ss", self._fail_count, BREAKER_COOLDOWN_SECONDS)
+            self._open_until = now + BREAKER_COOLDOWN_SECONDS
+            self._fail_count = 0
 
     def _flatten_and_clean(self, data: Any) -> List[Dict[str, Any]]:
         """
-        Recursively flattens nested structures and filters valid startup objects.
+        Flattens nested structures and filters valid startup objects.
+        Walks the tree with an explicit stack so deeply nested AI output
+        can't hit the recursion limit.
         """
         result = []
+        stack = [data]
         
-        if isinstance(data, dict):
-            # Check if this dict is a valid startup
-            if 'name' in data and 'description' in data and 'website' in data:
-                result.append(data)
-            else:
-                # Recurse into dict values
-                for value in data.values():
-                    result.extend(self._flatten_and_clean(value))
-        
-        elif isinstance(data, list):
-            for item in data:
-                if isinstance(item, dict) and 'name' in item and 'description' in item and 'website' in item:
-                    # Valid startup object
-                    result.append(item)
-                elif isinstance(item, (list, dict)):
-                    # Recurse into nested structures
-                    result.extend(self._flatten_and_clean(item))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                # Check if this dict is a valid startup
+                if 'name' in node and 'description' in node and 'website' in node:
+                    website = _clean_website(node['website'])
+                    if website is None:
+                        continue
+                    result.append({**node, 'website': website})
+                    if len(result) >= self.MAX_STARTUPS:
+                        break
+                else:
+                    # Pushed in reverse so items come out in document order
+                    stack.extend(reversed(node.values()))
+            elif isinstance(node, list):
+                stack.extend(reversed(node))
         
         return result
     
@@ -86,99 +273,199 @@ class CountryService:
             
             result = []
             for i in range(min(len(names), len(descriptions), len(websites))):
+                website = _clean_website(websites[i])
+                if website is None:
+                    continue
                 result.append({
                     'name': names[i],
                     'description': descriptions[i],
-                    'website': websites[i]
+                    'website': website
                 })
+                if len(result) >= self.MAX_STARTUPS:
+                    break
             return result
         
         return []
 
-    async def _get_real_fintech(self, country: str) -> List[FintechStartup]:
-        """Gets real fintech data using the Groq API with JSON mode."""
-        print(f"Getting fintech data for {country} (using Groq)...")
-        prompt = f"Find the top 5 current biggest or most influential fintech startups in {country}."
-        
-        system_prompt = """You are a financial data analyst. Return ONLY a valid JSON array of objects.
-Each object must have exactly these 3 fields:
-- "name": string (the startup's name)
-- "description": string (one sentence description)
-- "website": string (full URL starting with https://)
+    async def _get_country_payload(self, country: str) -> Tuple[Optional[str], List[FintechStartup]]:
+        """
+        Gets the history and fintech data for a country in a single Groq
+        request using JSON mode. The history is None if it could not be retrieved.
+        """
+        hit = self._precomputed.get(_normalize_country(country))
+        if hit is not None:
+            return hit
 
-Example format:
-[
-  {
-    "name": "Example Fintech",
-    "description": "A digital payment platform.",
-    "website": "https://example.com"
-  }
-]
+        logger.debug("Getting history and fintech data for %s (using Groq)...", country)
+        prompt = f"Provide a brief history of {country} and find the top 5 current biggest or most influential fintech startups in {country}."
 
-Return an empty array [] if no data is found. Do not add any other text."""
+        # Keyed on the normalized country like the in-memory cache; the user
+        # prompt template is covered by PROMPT_VERSION.
+        disk_key = hashlib.sha256(orjson.dumps(
+            {"m": self.model_name, "v": PROMPT_VERSION, "sys": _COUNTRY_SYSTEM_PROMPT, "c": _normalize_country(country)},
+            option=orjson.OPT_SORT_KEYS,
+        )).hexdigest()
+        # diskcache does blocking SQLite I/O, so it runs off the event loop.
+        hit = await asyncio.to_thread(self.disk_cache.get, disk_key)
+        if hit is not None:
+            history, startups = hit
+            # Stored from already-validated models, so skip re-validation.
+            return history, [FintechStartup.model_construct(**s) for s in startups]
 
         raw_text: str | None = None
         try:
-            chat_completion = await self.client.chat.completions.create(
+            chat_completion = await self._create_completion(
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": _COUNTRY_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                model=self.model_name,
                 response_format={"type": "json_object"},
+                temperature=0.2,
             )
             raw_text = chat_completion.choices[0].message.content
             if raw_text is None:
-                raise ValueError("API returned empty content for fintech")
-            
-            data = json.loads(raw_text)
+                raise ValueError("API returned empty content")
             
+            data = orjson.loads(raw_text)
+        except orjson.JSONDecodeError as e:
+            logger.error("Failed to decode JSON from AI response: %s", e)
+            logger.debug("Raw response was: %s", raw_text)
+            return None, []
+        except Exception as e:
+            logger.error("Error getting country data: %s", e)
+            return None, []
+
+        history = data.get("history") if isinstance(data, dict) else None
+        if not isinstance(history, str) or not history.strip():
+            logger.warning("AI returned JSON, but couldn't extract history: %s", raw_text)
+            history = None
+        else:
+            logger.debug("...History received.")
+
+        startups_data = data.get("startups", data) if isinstance(data, dict) else data
+        try:
+            startups = self._parse_startups(startups_data, raw_text)
+        except ValidationError as e:
+            logger.warning("AI data failed Pydantic validation, requesting a repair: %s", e)
+            logger.debug("Raw data was: %s", raw_text)
+            startups = await self._repair_startups(startups_data, e)
+
+        if history and startups:
+            await asyncio.to_thread(
+                self.disk_cache.set,
+                disk_key,
+                (history, [s.model_dump(mode="json") for s in startups]),
+                expire=DISK_CACHE_TTL_SECONDS,
+            )
+        return history, startups
+
+    async def _repair_startups(self, data: Any, error: ValidationError) -> List[FintechStartup]:
+        """
+        Sends startup data that failed validation back to the AI once and
+        asks it to fix it. Returns an empty list if the repair fails too.
+        """
+        prompt = f"Validation errors:\n{error}\n\nData:\n{orjson.dumps(data).decode()}"
+        raw_text: str | None = None
+        try:
+            chat_completion = await self._create_completion(
+                messages=[
+                    {"role": "system", "content": _REPAIR_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0,
+                max_tokens=800,
+            )
+            raw_text = chat_completion.choices[0].message.content
+            if raw_text is None:
+                raise ValueError("API returned empty content for repair")
+
+            repaired = orjson.loads(raw_text)
+            repaired = repaired.get("startups", repaired) if isinstance(repaired, dict) else repaired
+            return self._parse_startups(repaired, raw_text)
+        except ValidationError as e:
+            logger.error("Repaired AI data still failed Pydantic validation: %s", e)
+            logger.debug("Raw data was: %s", raw_text)
+            return []
+        except Exception as e:
+            logger.error("Error repairing fintech data: %s", e)
+            return []
+
+    def _parse_startups(self, data: Any, raw_text: str) -> List[FintechStartup]:
+        """
+        Normalizes and validates the startups part of the AI response.
+        Raises ValidationError so the caller can attempt a repair.
+        """
+        try:
             # Normalize the data structure
             data_list = self._normalize_startup_data(data)
             
             if not data_list:
-                print(f"AI returned JSON, but couldn't extract startups: {raw_text}")
+                logger.warning("AI returned JSON, but couldn't extract startups: %s", raw_text)
                 return []
             
             # Validate with Pydantic
-            validated_startups: List[FintechStartup] = TypeAdapter(List[FintechStartup]).validate_python(data_list)
-            print("...Fintech data received and parsed.")
+            validated_startups: List[FintechStartup] = _STARTUPS_ADAPTER.validate_python(data_list)
+            logger.debug("...Fintech data received and parsed.")
             return validated_startups
             
-        except json.JSONDecodeError as e:
-            print(f"Error: Failed to decode JSON from AI response: {e}")
-            print(f"Raw response was: {raw_text}")
-            return []
-        except ValidationError as e:
-            print(f"Error: AI data failed Pydantic validation: {e}")
-            print(f"Raw data was: {raw_text}")
-            return []
+        except ValidationError:
+            raise
         except Exception as e:
-            print(f"An unknown error occurred getting fintech: {e}")
+            logger.error("An unknown error occurred getting fintech: %s", e)
             return []
 
     async def get_country_details(self, country_name: str) -> str:
         """
         This is the main public method. It returns a formatted string.
         """
-        history_task = self._get_real_history(country_name)
-        fintech_task = self._get_real_fintech(country_name)
-        history_data, fintech_data = await asyncio.gather(history_task, fintech_task)
-
-        output_parts = []
-        output_parts.append(f"Here is the information you requested for **{country_name}**:\n")
-        output_parts.append("---")
-        output_parts.append("### History")
-        output_parts.append(history_data)
-        output_parts.append("\n---\n")
-        output_parts.append("### Top Fintech Startups")
-        
-        if not fintech_data:
-            output_parts.append("No fintech data could be found.")
-        else:
-            for i, startup in enumerate(fintech_data):
-                output_parts.append(f"**{i+1}. {startup.name}**")
-                output_parts.append(f" - *{startup.description}*")
-                output_parts.append(f" - {startup.website}")
-        
-        return "\n".join(output_parts)
\ No newline at end of file
+        key = _cache_key(self.model_name, country_name)
+        payload = self.cache.get(key)
+        if payload is None:
+            # Single-flight: concurrent lookups for the same country share one fetch.
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._fetch_country_payload(country_name, key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # Shielded so one caller being cancelled doesn't cancel the others.
+            payload = await asyncio.shield(task)
+        return self._format_details(country_name, *payload)
+
+    async def _fetch_country_payload(
+        self, country_name: str, key: Tuple[str, int, str]
+    ) -> Tuple[Optional[str], List[FintechStartup]]:
+        """Fetches the payload for a country, caching successes."""
+        history_data, fintech_data = await self._get_country_payload(country_name)
+        if history_data and fintech_data:
+            self.cache[key] = (history_data, fintech_data)
+        return history_data, fintech_data
+
+    @staticmethod
+    def _format_details(
+        country_name: str, history_data: Optional[str], fintech_data: List[FintechStartup]
+    ) -> str:
+        """Renders the markdown reply, using the country name as the caller spelled it."""
+        history_md = history_data or f"Error: Could not retrieve history for {country_name}."
+        startups_md = "\n".join(
+            f"**{i+1}. {startup.name}**\n - *{startup.description}*\n - {startup.website}"
+            for i, startup in enumerate(fintech_data)
+        ) if fintech_data else "No fintech data could be found."
+
+        return (
+            f"Here is the information you requested for **{country_name}**:\n\n"
+            f"---\n### History\n{history_md}\n\n---\n\n"
+            f"### Top Fintech Startups\n{startups_md}"
+        )
+
+    async def aclose(self) -> None:
+        """Releases the disk cache and the shared Groq client."""
+        self.disk_cache.close()
+        await close_client()
+
+    async def get_many_country_details(self, countries: List[str]) -> List[str]:
+        """
+        Returns the formatted details for several countries, fetched
+        concurrently. Groq calls are still bounded by the shared semaphore.
+        """
+        return await asyncio.gather(*(self.get_country_details(c) for c in countries))
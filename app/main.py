@@ -1,20 +1,69 @@
 from fastapi import FastAPI, Response, Request, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Optional, Tuple
 import os
+import re
+import asyncio
 import uuid
-import json
+import logging
+import logging.handlers
+import queue
 import httpx
+import orjson
+from contextlib import asynccontextmanager
 
 from app.country_service import CountryService
 
+# Log records are handed to a background thread, so request handlers
+# never block on writing to stdout.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_log_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[_log_queue_handler])
+# httpx logs every request at INFO, including each Groq call.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r'<[^>]+>')
+# Parts that are HTML, error messages or agent instructions rather than a country
+_SKIP_RE = re.compile(r'^[<\n]|Sorry|You are a')
+
+# Upper bound on /tasks/send bodies; Telex payloads are a few KB.
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(256 * 1024)))
+
+# Caps how many background webhook tasks run at once.
+BG_CONCURRENCY = int(os.getenv("BG_CONCURRENCY", "8"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _log_listener.start()
+    # Built per worker at startup rather than at import time.
+    app.state.service = CountryService()
+    # Shared client for webhook deliveries so keep-alive connections are reused.
+    app.state.webhook_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=30),
+    )
+    # Created here rather than at import so it belongs to the running loop.
+    app.state.bg_sem = asyncio.Semaphore(BG_CONCURRENCY)
+    yield
+    await app.state.webhook_client.aclose()
+    await app.state.service.aclose()
+    _log_listener.stop()
+
 app = FastAPI(
     title="Country Info A2A Agent",
     description="An AI agent that provides history and fintech info for countries.",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-service = CountryService()
-
+# These models document the JSON-RPC payloads. The hot paths build plain
+# dicts of the same shape instead of constructing and validating models.
 class ChatMessagePart(BaseModel):
     kind: str = "text"
     text: str
@@ -23,7 +72,7 @@ class ChatMessage(BaseModel):
     kind: str = "message"
     role: str = "agent"
     parts: List[ChatMessagePart]
-    messageId: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    messageId: str = Field(default_factory=lambda: uuid.uuid4().hex)
 
 class MessageParams(BaseModel):
     message: ChatMessage
@@ -34,166 +83,253 @@ class ChatRpcRequest(BaseModel):
     method: str = "message/send"
     params: MessageParams
 
+def _agent_message(text: str) -> dict:
+    """Builds a ChatMessage-shaped dict for an agent reply."""
+    return {
+        "kind": "message",
+        "role": "agent",
+        "parts": [{
+            "kind": "text",
+            "text": text
+        }],
+        "messageId": uuid.uuid4().hex
+    }
+
 # --- Background Task ---
+def _auth_headers(token: Optional[str]) -> dict:
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+async def _warm_webhook_connection(client: httpx.AsyncClient, webhook_url: str) -> None:
+    """
+    Opens a pooled connection to the webhook host (DNS, TCP, TLS) while
+    the country details are still being generated. The response is ignored.
+    """
+    try:
+        await client.head(webhook_url)
+    except Exception as e:
+        logger.debug("Webhook warm-up failed: %s", e)
+
 async def process_and_send_response(
+    service: CountryService,
+    client: httpx.AsyncClient,
+    bg_sem: asyncio.Semaphore,
     country_name: str,
     webhook_url: str,
     request_id: str,
     token: Optional[str] = None
 ):
-    print(f"--- BACKGROUND TASK: Processing for {country_name} ---")
-    try:
-        chat_response_string: str = await service.get_country_details(country_name)
+    async with bg_sem:
+        logger.info("Background task: processing %s", country_name)
+        # Not awaited: if the warm-up is still running when the details are
+        # ready, the POST opens its own connection rather than waiting on it.
+        warmup = asyncio.create_task(_warm_webhook_connection(client, webhook_url))
+        try:
+            chat_response_string: str = await service.get_country_details(country_name)
     
-        response_message = ChatMessage(
-            kind="message",
-            role="agent",
-            parts=[ChatMessagePart(kind="text", text=chat_response_string)]
-        )
-        
-        json_request = ChatRpcRequest(
-            id=request_id,
-            method="message/send",
-            params=MessageParams(message=response_message)
-        )
-        
-        # Send to webhook
-        headers = {"Content-Type": "application/json"}
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
+            json_request = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": "message/send",
+                "params": {"message": _agent_message(chat_response_string)}
+            }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            print(f"--- Sending response to webhook ---")
+            # Send to webhook
+            logger.debug("Sending response to webhook")
             response = await client.post(
                 webhook_url,
-                json=json_request.model_dump(mode='json'),
-                headers=headers
+                content=orjson.dumps(json_request),
+                headers=_auth_headers(token)
             )
-            print(f"--- Webhook response: {response.status_code} - {response.text} ---")
+            logger.info("Webhook response: %s (%d B)", response.status_code, len(response.content))
+            if response.is_error:
+                logger.warning("Webhook error body: %s", response.content[:512].decode('utf-8', 'replace'))
         
-        print(f"--- BACKGROUND TASK: Complete ---")
+            logger.info("Background task: complete")
         
-    except Exception as e:
-        print(f"--- BACKGROUND TASK ERROR: {str(e)} ---")
-        import traceback
-        print(traceback.format_exc())
+        except Exception as e:
+            logger.exception("Background task error: %s", e)
+            # Let the caller know the task failed instead of leaving it waiting.
+            try:
+                await client.post(
+                    webhook_url,
+                    content=orjson.dumps({
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32000,
+                            "message": f"Failed to process request: {str(e)}"
+                        }
+                    }),
+                    headers=_auth_headers(token)
+                )
+            except Exception as send_error:
+                logger.error("Could not deliver error to webhook: %s", send_error)
+        finally:
+            warmup.cancel()
 
 # --- Agent Manifest ---
-@app.get("/.well-known/agent.json")
-async def agent_manifest():
-    base_url = os.getenv("AGENT_BASE_URL", "http://localhost:8000")
-    return {
-        "name": "CountryInfoAgent",
-        "description": "An AI agent that provides history and top fintech startups for a specific country.",
-        "url": base_url,
-        "version": "1.0.0",
-        "skills": [
-            {
-                "id": "get_country_details",
-                "name": "Get Country Details",
-                "description": "Fetches the history and a list of top fintech startups for a specific country.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "country_name": {
-                            "type": "string",
-                            "description": "The name of the country to query."
-                        }
-                    },
-                    "required": ["country_name"]
-                }
+# The manifest never changes while the process runs, so it is encoded once.
+_BASE_URL = os.getenv("AGENT_BASE_URL", "http://localhost:8000")
+_MANIFEST_BYTES = orjson.dumps({
+    "name": "CountryInfoAgent",
+    "description": "An AI agent that provides history and top fintech startups for a specific country.",
+    "url": _BASE_URL,
+    "version": "1.0.0",
+    "skills": [
+        {
+            "id": "get_country_details",
+            "name": "Get Country Details",
+            "description": "Fetches the history and a list of top fintech startups for a specific country.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "country_name": {
+                        "type": "string",
+                        "description": "The name of the country to query."
+                    }
+                },
+                "required": ["country_name"]
             }
-        ],
-        "endpoints": {
-            "task_send": f"{base_url}/tasks/send"
         }
+    ],
+    "endpoints": {
+        "task_send": f"{_BASE_URL}/tasks/send"
     }
+})
+
+@app.get("/.well-known/agent.json")
+async def agent_manifest():
+    return Response(content=_MANIFEST_BYTES, media_type="application/json")
+
+# --- Request Parsing ---
+# Written EAFP-style: Telex payloads almost always have the expected shape,
+# so the happy path is plain indexing rather than isinstance/in checks.
+def _extract_country_name(params: dict) -> Optional[str]:
+    """
+    Finds the country name in the request params: a structured input
+    first, otherwise the first text part that looks like a user message.
+    """
+    try:
+        country_name = params["input"]["country_name"]
+        if country_name:
+            return country_name
+    except (KeyError, TypeError):
+        pass
+
+    try:
+        parts = params["message"]["parts"]
+    except (KeyError, TypeError):
+        return None
+
+    for part in parts:
+        try:
+            if part["kind"] != "text":
+                continue
+            text = part["text"].strip()
+        except (KeyError, TypeError, AttributeError):
+            continue
+        # Skip HTML, errors, and long instructions
+        if text and len(text) < 100 and not _SKIP_RE.search(text):
+            return text
+    return None
+
+def _extract_push_config(params: dict) -> Tuple[Optional[str], Optional[str]]:
+    """Returns the (webhook_url, token) push notification settings, if any."""
+    try:
+        push_config = params["configuration"]["pushNotificationConfig"]
+        return push_config.get("url"), push_config.get("token")
+    except (KeyError, TypeError, AttributeError):
+        return None, None
+
+async def _read_body_limited(request: Request) -> Optional[bytes]:
+    """
+    Reads the request body, or returns None once it is known to exceed
+    MAX_REQUEST_BYTES. Content-Length is checked before anything is read;
+    chunked bodies are cut off as soon as they cross the limit.
+    """
+    try:
+        if int(request.headers.get("content-length", 0)) > MAX_REQUEST_BYTES:
+            return None
+    except ValueError:
+        pass
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_REQUEST_BYTES:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 # --- Task Endpoint ---
 @app.post("/tasks/send")
 async def tasks_send(request: Request, background_tasks: BackgroundTasks):
+    service: CountryService = request.app.state.service
     raw_body = {}
     request_id = "unknown"
     
     try:
-        raw_body = await request.json()
-        request_id = raw_body.get("id", f"telex-{uuid.uuid4()}")
+        body = await _read_body_limited(request)
+        if body is None:
+            return ORJSONResponse({
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {
+                    "code": -32600,
+                    "message": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"
+                }
+            }, status_code=413)
+        raw_body = orjson.loads(body)
+        request_id = raw_body.get("id")
+        if request_id is None:
+            request_id = f"telex-{uuid.uuid4().hex}"
         
-        print(f"--- Received request {request_id} ---")
+        logger.debug("Received request %s", request_id)
         
-        country_name_raw = None
         params = raw_body.get("params", {})
-
-        if "input" in params and isinstance(params.get("input"), dict):
-            country_name_raw = params["input"].get("country_name")
-        
-        if not country_name_raw and "message" in params:
-            message = params.get("message", {})
-            parts = message.get("parts", [])
-            
-            for part in parts:
-                if part.get("kind") == "text" and "text" in part:
-                    text = part["text"].strip()
-                    # Skip HTML, errors, and long instructions
-                    if (text and 
-                        not text.startswith("<") and 
-                        not text.startswith("\n") and
-                        "Sorry" not in text and
-                        "You are a" not in text and
-                        len(text) < 100):
-                        country_name_raw = text
-                        break
+        country_name_raw = _extract_country_name(params)
         
         if not country_name_raw:
             raise ValueError("Could not find country name in request")
         
-        country_name = country_name_raw.split()[0]
+        country_name = country_name_raw.split(None, 1)[0]
         if "<" in country_name:
-            import re
-            country_name = re.sub(r'<[^>]+>', '', country_name).strip()
+            country_name = _TAG_RE.sub('', country_name).strip()
         
-        print(f"--- Country: {country_name} ---")
+        logger.debug("Country: %s", country_name)
         
-        config_obj = params.get("configuration", {})
-        push_config = config_obj.get("pushNotificationConfig", {})
-        webhook_url = push_config.get("url")
-        token = push_config.get("token")
+        webhook_url, token = _extract_push_config(params)
         
         blocking = True
         
-        print(f"--- FORCED Blocking mode: {blocking} ---")
-        print(f"--- Webhook URL: {webhook_url} ---")
+        logger.debug("FORCED Blocking mode: %s", blocking)
+        logger.debug("Webhook URL: %s", webhook_url)
         
-        print(f"--- BLOCKING MODE: Processing synchronously ---")
+        logger.debug("BLOCKING MODE: Processing synchronously")
         chat_response = await service.get_country_details(country_name)
         
-        return {
+        # Returned as a Response so FastAPI skips jsonable_encoder.
+        return ORJSONResponse({
             "jsonrpc": "2.0",
             "id": request_id,
-            "result": {
-                "kind": "message",
-                "role": "agent",
-                "parts": [{
-                    "kind": "text",
-                    "text": chat_response
-                }],
-                "messageId": str(uuid.uuid4())
-            }
-        }
+            "result": _agent_message(chat_response)
+        })
         
     except Exception as e:
-        print(f"--- ERROR: {str(e)} ---")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error processing request %s: %s", request_id, e)
         
-        return {
+        return ORJSONResponse({
             "jsonrpc": "2.0",
             "id": request_id,
             "error": {
                 "code": -32000,
                 "message": f"Failed to process request: {str(e)}"
             }
-        }
+        })
 
 @app.get("/")
 def read_root():